@@ -106,6 +106,7 @@ class SbyProc:
         self.output_callback = None
         self.exit_callbacks = []
         self.error_callback = None
+        self.fail_task_on_error = True
 
         if self.task.timeout_reached:
             self.terminate(True)
@@ -151,6 +152,8 @@ class SbyProc:
     def terminate(self, timeout=False):
         if (self.task.opt_wait or self.wait) and not timeout:
             return
+        if self.logfile is not None and not self.logfile.closed:
+            self.logfile.flush()
         if self.running:
             if not self.silent:
                 self.task.log(f"{click.style(self.info, fg='magenta')}: terminating process")
@@ -238,7 +241,8 @@ class SbyProc:
                     self.task.log(f"{click.style(self.info, fg='magenta')}: COMMAND NOT FOUND. ERROR.")
                 self.handle_error(returncode)
                 self.terminated = True
-                self.task.proc_failed(self)
+                if self.fail_task_on_error:
+                    self.task.proc_failed(self)
                 return
 
             if self.checkretcode and returncode not in self.retcodes:
@@ -246,7 +250,8 @@ class SbyProc:
                     self.task.log(f"{click.style(self.info, fg='magenta')}: task failed. ERROR.")
                 self.handle_error(returncode)
                 self.terminated = True
-                self.task.proc_failed(self)
+                if self.fail_task_on_error:
+                    self.task.proc_failed(self)
                 return
 
             self.handle_exit(returncode)
@@ -185,6 +185,8 @@ def run(mode, task, engine_idx, engine):
                 proc = aigsmt_trace_callback(task, engine_idx, proc_status,
                     run_aigsmt=run_aigsmt, smtbmc_vcd=smtbmc_vcd, smtbmc_append=smtbmc_append, sim_append=sim_append,
                     name=match[2],
+                    # abc may still be writing the witness file at this point
+                    cache_witness=False,
                 )
                 proc.register_exit_callback(exit_callback)
                 procs_running += 1
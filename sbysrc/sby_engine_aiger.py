@@ -16,62 +16,133 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 
-import re, os, getopt, click, json
+import re, os, click, json, hashlib, shutil
+from functools import lru_cache, partial
+from types import SimpleNamespace
 from sby_core import SbyProc
 from sby_sim import sim_witness_trace
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+step_re = re.compile(r"^## [0-9: ]+ .* in step ([0-9]+)\.\.")
+status_failed_re = re.compile(r"^## [0-9: ]+ Status: FAILED")
+status_passed_re = re.compile(r"^## [0-9: ]+ Status: PASSED")
+assert_failed_re = re.compile(r"^## [0-9: ]+ Assert failed in ([^:]+): (\S+)(?: \((\S+)\))?")
+vcd_trace_re = re.compile(r"^## [0-9: ]+ Writing trace to VCD file: (\S+)")
+mod_path_re = re.compile(r"\\([^ ]*) |([^.]+)")
+
+# AIGER result line to engine status, "2" depends on the solver
+status_map = {"0": "PASS", "1": "FAIL", "2": None}
+
+smt2_trans = {'\\':'/', '|':'/'}
+
+@lru_cache(maxsize=256)
+def parse_mod_path(path_string):
+    # Match a path with . as delimiter, allowing escaped tokens in
+    # verilog `\name ` format
+    return tuple(m[1] if m[1] is not None else m[2] for m in mod_path_re.finditer(path_string))
+
+# Ordered by expected frequency
+log_levels = ("INFO", "TRACE", "DEBUG", "WARN", "ERROR")
+
+def split_log_level(line):
+    # Find the first log level keyword, skipping the prefix containing
+    # runtime and memory stats
+    idx = -1
+    level = None
+    for candidate in log_levels:
+        j = line.find(candidate + " ")
+        if j != -1 and (idx == -1 or j < idx):
+            idx = j
+            level = candidate
+    if level is None:
+        return None
+    return level, line[idx + len(level) + 1:]
+
+def build_suprove(mode, task, solver_args):
+    if mode not in ["live", "prove"]:
+        task.error("The aiger solver 'suprove' is only supported in live and prove modes.")
+    if mode == "live" and (len(solver_args) == 1 or solver_args[1][0] != "+"):
+        solver_args.insert(1, "+simple_liveness")
+    solver_cmd = " ".join([task.exe_paths["suprove"]] + solver_args[1:])
+    return solver_cmd, "", False, "UNKNOWN", True
+
+def build_avy(mode, task, solver_args):
+    if mode != "prove":
+        task.error("The aiger solver 'avy' is only supported in prove mode.")
+    solver_cmd = " ".join([task.exe_paths["avy"], "--cex", "-"] + solver_args[1:])
+    return solver_cmd, "_fold", False, "UNKNOWN", False
+
+def build_ric3(mode, task, solver_args):
+    if mode not in ["bmc", "prove"]:
+        task.error("The aiger solver 'rIC3' is only supported in bmc and prove mode.")
+    if mode == "bmc":
+        solver_cmd = " ".join([task.exe_paths["rIC3"], "--bmc-max-k {}".format(task.opt_depth - 1), "-e bmc", "-v 1", "--witness"] + solver_args[1:])
+        return solver_cmd, "", False, "PASS", False  # rIC3 outputs status 2 when BMC passes
+    solver_cmd = " ".join([task.exe_paths["rIC3"], "--witness"] + solver_args[1:])
+    return solver_cmd, "", False, "UNKNOWN", False
+
+def build_aigbmc(mode, task, solver_args):
+    if mode != "bmc":
+        task.error("The aiger solver 'aigbmc' is only supported in bmc mode.")
+    solver_cmd = " ".join([task.exe_paths["aigbmc"], str(task.opt_depth - 1)] + solver_args[1:])
+    return solver_cmd, "", False, "PASS", True  # aigbmc outputs status 2 when BMC passes
+
+def build_imctk(mode, task, solver_args):
+    if mode != "prove":
+        task.error("The aiger solver 'imctk-eqy-engine' is only supported in prove mode.")
+    args = ["--bmc-depth", str(task.opt_depth), "--jsonl-output"]
+    solver_cmd = " ".join([task.exe_paths["imctk-eqy-engine"], *args, *solver_args[1:]])
+    return solver_cmd, "_fold", True, "UNKNOWN", True
+
+# Each builder returns (solver_cmd, model_variant, json_output, status_2, checkretcode)
+solver_builders = {
+    "suprove": build_suprove,
+    "avy": build_avy,
+    "rIC3": build_ric3,
+    "aigbmc": build_aigbmc,
+    "imctk-eqy-engine": build_imctk,
+}
+
+def solver_command(mode, task, solver_args):
+    try:
+        builder = solver_builders[solver_args[0]]
+    except KeyError:
+        task.error(f"Invalid solver command {solver_args[0]}.")
+    return builder(mode, task, solver_args)
+
 def run(mode, task, engine_idx, engine):
-    opts, solver_args = getopt.getopt(engine[1:], "", [])
+    # The aiger engine has no engine options
+    solver_args = list(engine[1:])
 
     if len(solver_args) == 0:
         task.error("Missing solver command.")
 
-    for o, a in opts:
+    if solver_args[0].startswith("-"):
         task.error("Unexpected AIGER engine options.")
 
-    status_2 = "UNKNOWN"
-
-    model_variant = ""
-    json_output = False
-
-    if solver_args[0] == "suprove":
-        if mode not in ["live", "prove"]:
-            task.error("The aiger solver 'suprove' is only supported in live and prove modes.")
-        if mode == "live" and (len(solver_args) == 1 or solver_args[1][0] != "+"):
-            solver_args.insert(1, "+simple_liveness")
-        solver_cmd = " ".join([task.exe_paths["suprove"]] + solver_args[1:])
-
-    elif solver_args[0] == "avy":
-        model_variant = "_fold"
-        if mode != "prove":
-            task.error("The aiger solver 'avy' is only supported in prove mode.")
-        solver_cmd = " ".join([task.exe_paths["avy"], "--cex", "-"] + solver_args[1:])
-    
-    elif solver_args[0] == "rIC3":
-        if mode not in ["bmc", "prove"]:
-            task.error("The aiger solver 'rIC3' is only supported in bmc and prove mode.")
-        if mode == "prove":
-            solver_cmd = " ".join([task.exe_paths["rIC3"], "--witness"] + solver_args[1:])
-        if mode == "bmc":
-            solver_cmd = " ".join([task.exe_paths["rIC3"], "--bmc-max-k {}".format(task.opt_depth - 1), "-e bmc", "-v 1", "--witness"] + solver_args[1:])
-            status_2 = "PASS"  # rIC3 outputs status 2 when BMC passes
-
-    elif solver_args[0] == "aigbmc":
-        if mode != "bmc":
-            task.error("The aiger solver 'aigbmc' is only supported in bmc mode.")
-        solver_cmd = " ".join([task.exe_paths["aigbmc"], str(task.opt_depth - 1)] + solver_args[1:])
-        status_2 = "PASS"  # aigbmc outputs status 2 when BMC passes
-
-    elif solver_args[0] == "imctk-eqy-engine":
-        model_variant = "_fold"
-        json_output = True
-        if mode != "prove":
-            task.error("The aiger solver 'imctk-eqy-engine' is only supported in prove mode.")
-        args = ["--bmc-depth", str(task.opt_depth), "--jsonl-output"]
-        solver_cmd = " ".join([task.exe_paths["imctk-eqy-engine"], *args, *solver_args[1:]])
-
+    if solver_args[0] == "portfolio":
+        if len(solver_args) != 2:
+            task.error("The aiger solver 'portfolio' expects a single comma separated list of solvers.")
+        portfolio_solvers = [[solver] for solver in solver_args[1].split(",") if solver]
+        if len(portfolio_solvers) == 0:
+            task.error("Missing solvers for the aiger solver 'portfolio'.")
+        portfolio_names = [solver[0] for solver in portfolio_solvers]
+        for solver in portfolio_names:
+            if portfolio_names.count(solver) > 1:
+                task.error(f"Duplicate solver '{solver}' for the aiger solver 'portfolio'.")
+        portfolio = SimpleNamespace()
+        portfolio.pending = len(portfolio_solvers)
+        portfolio.status = None
+        portfolio.done = False
     else:
-        task.error(f"Invalid solver command {solver_args[0]}.")
+        portfolio_solvers = [solver_args]
+        portfolio = None
+
+    solvers = [(args[0], *solver_command(mode, task, args)) for args in portfolio_solvers]
 
     smtbmc_vcd = task.opt_vcd and not task.opt_vcd_sim
     run_aigsmt = (mode != "live") and (smtbmc_vcd or (task.opt_append and task.opt_append_assume))
@@ -89,77 +160,121 @@ def run(mode, task, engine_idx, engine):
         else:
             sim_append = task.opt_append
 
-    proc = SbyProc(
-        task,
-        f"engine_{engine_idx}",
-        task.model(f"aig{model_variant}"),
-        f"cd {task.workdir}; {solver_cmd} model/design_aiger{model_variant}.aig",
-        logfile=open(f"{task.workdir}/engine_{engine_idx}/logfile.txt", "w")
-    )
-    if solver_args[0] not in ["avy", "rIC3"]:
-        proc.checkretcode = True
-
-    proc_status = None
-    produced_cex = False
-    end_of_cex = False
-    aiw_file = open(f"{task.workdir}/engine_{engine_idx}/trace.aiw", "w")
-
-    def output_callback(line):
-        nonlocal proc_status
-        nonlocal produced_cex
-        nonlocal end_of_cex
-
-        if json_output:
-            # Forward log messages, but strip the prefix containing runtime and memory stats
-            if not line.startswith('{'):
-                print(line, file=proc.logfile, flush=True)
-                matched = re.match(r".*(TRACE|DEBUG|INFO|WARN|ERROR) (.*)", line)
-                if matched:
-                    if matched[1] == "INFO":
-                        task.log(matched[2])
-                    else:
-                        task.log(f"{matched[1]} {matched[2]}")
-                return None
-            event = json.loads(line)
-            if "aiw" in event:
-                print(event["aiw"], file=aiw_file)
-            if "status" in event:
-                if event["status"] == "pass":
-                    proc_status = "PASS"
-                elif event["status"] == "fail":
-                    proc_status = "FAIL"
-            return None
-
-        if proc_status is not None:
-            if not end_of_cex and not produced_cex and line.isdigit():
-                produced_cex = True
-            if not end_of_cex:
-                print(line, file=aiw_file)
-            if line == ".":
-                end_of_cex = True
-            return None
-        
-        if line.startswith("bmc depth:"):
-            return line
-
-        if line.startswith("u"):
-            return f"No CEX up to depth {int(line[1:])-1}."
+    for solver, solver_cmd, model_variant, json_output, status_2, checkretcode in solvers:
+        if portfolio is None:
+            info = f"engine_{engine_idx}"
+            logfile = f"{task.workdir}/engine_{engine_idx}/logfile.txt"
+        else:
+            info = f"engine_{engine_idx}.{solver}"
+            logfile = f"{task.workdir}/engine_{engine_idx}/logfile_{solver}.txt"
 
-        if line in ["0", "1", "2"]:
-            print(line, file=aiw_file)
-            if line == "0": proc_status = "PASS"
-            if line == "1": proc_status = "FAIL"
-            if line == "2": proc_status = status_2
+        proc = SbyProc(
+            task,
+            info,
+            task.model(f"aig{model_variant}"),
+            f"cd {task.workdir}; {solver_cmd} model/design_aiger{model_variant}.aig",
+            logfile=open(logfile, "w")
+        )
+        proc.checkretcode = checkretcode
+
+        state = SimpleNamespace()
+        state.task = task
+        state.proc = proc
+        state.task_log = task.log
+        state.engine_idx = engine_idx
+        state.portfolio = portfolio
+        state.status_2 = status_2
+        state.proc_status = None
+        state.produced_cex = False
+        state.end_of_cex = False
+        state.aiw_lines = []
+        state.aigsmt_opts = dict(run_aigsmt=run_aigsmt, smtbmc_vcd=smtbmc_vcd, smtbmc_append=smtbmc_append, sim_append=sim_append)
+
+        proc.output_callback = partial(aiger_json_output_callback if json_output else aiger_output_callback, state)
+        proc.register_exit_callback(partial(aiger_exit_callback, state))
+        if portfolio is not None:
+            # A failing solver only drops out of the portfolio
+            proc.fail_task_on_error = False
+            proc.error_callback = partial(aiger_portfolio_error_callback, state)
+
+def aiger_json_output_callback(state, line):
+    # Forward log messages, but strip the prefix containing runtime and memory stats
+    if line[0] != "{":
+        logfile = state.proc.logfile
+        logfile.write(line)
+        logfile.write("\n")
+        matched = split_log_level(line)
+        if matched:
+            level, message = matched
+            if level == "INFO":
+                state.task_log(message)
+            else:
+                state.task_log(level + " " + message)
+        return None
+    event = json_loads(line)
+    if "aiw" in event:
+        state.aiw_lines.append(event["aiw"])
+    if "status" in event:
+        if event["status"] == "pass":
+            state.proc_status = "PASS"
+        elif event["status"] == "fail":
+            state.proc_status = "FAIL"
+    return None
+
+def aiger_output_callback(state, line):
+    if state.end_of_cex:
+        return None
 
+    if state.proc_status is not None:
+        if not state.produced_cex and line[0] in "0123456789":
+            state.produced_cex = True
+        state.aiw_lines.append(line)
+        if line == ".":
+            state.end_of_cex = True
         return None
 
-    def exit_callback(retcode):
-        aiw_file.close()
-        aigsmt_exit_callback(task, engine_idx, proc_status,
-            run_aigsmt=run_aigsmt, smtbmc_vcd=smtbmc_vcd, smtbmc_append=smtbmc_append, sim_append=sim_append, )
+    if len(line) == 1 and line in status_map:
+        state.aiw_lines.append(line)
+        state.proc_status = status_map[line] or state.status_2
+        return None
 
-    proc.output_callback = output_callback
-    proc.register_exit_callback(exit_callback)
+    if line.startswith("bmc depth:"):
+        return line
+
+    if line.startswith("u"):
+        return f"No CEX up to depth {int(line[1:])-1}."
+
+    return None
+
+def aiger_portfolio_error_callback(state, retcode):
+    state.proc_status = None
+    aiger_exit_callback(state, retcode)
+
+def aiger_exit_callback(state, retcode):
+    portfolio = state.portfolio
+    if portfolio is not None:
+        # Only the first decisive result of a portfolio is reported, later
+        # ones can still arrive when the task runs with 'wait on'
+        if portfolio.done:
+            return
+        if state.proc_status not in ["PASS", "FAIL"]:
+            # Keep waiting for the remaining solvers of the portfolio, the first
+            # decisive result terminates all of them
+            portfolio.pending -= 1
+            if portfolio.status is None:
+                portfolio.status = state.proc_status
+            if portfolio.pending > 0:
+                state.task_log(f"{click.style(state.proc.info, fg='magenta')}: solver finished without a result, waiting for remaining portfolio solvers")
+                return
+            state.proc_status = portfolio.status
+        portfolio.done = True
+
+    # The witness is only consumed by aiw2yw, which only runs for a failing result
+    if state.proc_status == "FAIL":
+        with open(f"{state.task.workdir}/engine_{state.engine_idx}/trace.aiw", "w") as aiw_file:
+            aiw_file.write("\n".join(state.aiw_lines))
+            aiw_file.write("\n")
+    aigsmt_exit_callback(state.task, state.engine_idx, state.proc_status, **state.aigsmt_opts)
 
 
 def aigsmt_exit_callback(task, engine_idx, proc_status, *, run_aigsmt, smtbmc_vcd, smtbmc_append, sim_append):
@@ -172,105 +287,163 @@ def aigsmt_exit_callback(task, engine_idx, proc_status, *, run_aigsmt, smtbmc_vc
     if proc_status == "FAIL" and (not run_aigsmt or task.opt_aigsmt != "none"):
         aigsmt_trace_callback(task, engine_idx, proc_status, run_aigsmt=run_aigsmt, smtbmc_vcd=smtbmc_vcd, smtbmc_append=smtbmc_append, sim_append=sim_append)
 
-def aigsmt_trace_callback(task, engine_idx, proc_status, *, run_aigsmt, smtbmc_vcd, smtbmc_append, sim_append, name="trace"):
+def aiw2yw_cache_file(task, aiw_file, ywa_file):
+    # Conversion results are cached by content when SBY_CACHE_DIR is set. The
+    # key includes the witness tool so that updating it invalidates the cache.
+    cache_dir = os.getenv("SBY_CACHE_DIR")
+    if not cache_dir:
+        return None
+    cache_dir = os.path.abspath(cache_dir)
+
+    h = hashlib.blake2b(digest_size=16)
+    witness_exe = task.exe_paths["witness"]
+    h.update(witness_exe.encode())
+    witness_path = shutil.which(witness_exe)
+    if witness_path is not None:
+        st = os.stat(witness_path)
+        h.update(f"\0{st.st_size}\0{st.st_mtime_ns}".encode())
+    for filename in [aiw_file, ywa_file]:
+        if not os.path.exists(filename):
+            # Leave reporting the missing input to aiw2yw
+            return None
+        h.update(b"\0")
+        with open(filename, "rb") as f:
+            h.update(f.read())
 
-    trace_prefix = f"engine_{engine_idx}/{name}"
+    return os.path.join(cache_dir, "aiw2yw", f"{h.hexdigest()}.yw")
+
+def aigsmt_trace_callback(task, engine_idx, proc_status, *, run_aigsmt, smtbmc_vcd, smtbmc_append, sim_append, name="trace", cache_witness=True):
+    # Returns the last process of the trace generation, or None when a cached
+    # witness conversion leaves no process to run
+    workdir = task.workdir
+    exe_paths = task.exe_paths
+    witness_exe, smtbmc_exe = exe_paths["witness"], exe_paths["smtbmc"]
+
+    engine_dir = f"engine_{engine_idx}"
+    trace_prefix = f"{engine_dir}/{name}"
+    aiw_file = f"{trace_prefix}.aiw"
 
     aiw2yw_suffix = '_aiw' if run_aigsmt else ''
 
-    witness_proc = SbyProc(
-        task, f"engine_{engine_idx}", [],
-        f"cd {task.workdir}; {task.exe_paths['witness']} aiw2yw engine_{engine_idx}/{name}.aiw model/design_aiger.ywa engine_{engine_idx}/{name}{aiw2yw_suffix}.yw",
-    )
+    yw_file = f"{trace_prefix}{aiw2yw_suffix}.yw"
+    # Only cache witnesses that are complete when the trace callback runs
+    cache_file = None
+    if cache_witness:
+        cache_file = aiw2yw_cache_file(task, f"{workdir}/{aiw_file}", f"{workdir}/model/design_aiger.ywa")
+
+    if cache_file is not None and os.path.exists(cache_file):
+        task.log(f"{click.style(engine_dir, fg='magenta')}: Using cached witness conversion {cache_file}")
+        shutil.copyfile(cache_file, f"{workdir}/{yw_file}")
+        witness_proc = None
+    else:
+        witness_proc = SbyProc(
+            task, engine_dir, [],
+            f"cd {workdir}; {witness_exe} aiw2yw {aiw_file} model/design_aiger.ywa {yw_file}",
+        )
+
+        if cache_file is not None:
+            def witness_exit_callback(retcode):
+                if retcode != 0 or not os.path.exists(f"{workdir}/{yw_file}"):
+                    return
+                os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+                shutil.copyfile(f"{workdir}/{yw_file}", tmp_file)
+                os.replace(tmp_file, cache_file)
+
+            witness_proc.register_exit_callback(witness_exit_callback)
     final_proc = witness_proc
 
     if run_aigsmt:
-        smtbmc_opts = []
-        smtbmc_opts += ["-s", task.opt_aigsmt]
+        # VCD and testbench names carry the engine index, unlike the other outputs
+        vcd_out = f"{trace_prefix}{engine_idx}.vcd"
+        tb_out = f"{trace_prefix}{engine_idx}_tb.v"
+
+        smtbmc_opts = ["-s", task.opt_aigsmt]
         if task.opt_tbtop is not None:
-            smtbmc_opts  += ["--vlogtb-top", task.opt_tbtop]
+            smtbmc_opts += ["--vlogtb-top", task.opt_tbtop]
         smtbmc_opts += ["--noprogress", f"--append {smtbmc_append}"]
         if smtbmc_vcd:
-            smtbmc_opts += [f"--dump-vcd {trace_prefix}{engine_idx}.vcd"]
-        smtbmc_opts += [f"--dump-yw {trace_prefix}.yw", f"--dump-vlogtb {trace_prefix}{engine_idx}_tb.v", f"--dump-smtc {trace_prefix}.smtc"]
+            smtbmc_opts.append(f"--dump-vcd {vcd_out}")
+        smtbmc_opts += [f"--dump-yw {trace_prefix}.yw", f"--dump-vlogtb {tb_out}", f"--dump-smtc {trace_prefix}.smtc"]
 
         proc2 = SbyProc(
             task,
-            f"engine_{engine_idx}",
-            [*task.model("smt2"), witness_proc],
-            f"cd {task.workdir}; {task.exe_paths['smtbmc']} {' '.join(smtbmc_opts)} --yw engine_{engine_idx}/{name}{aiw2yw_suffix}.yw model/design_smt2.smt2",
-            logfile=open(f"{task.workdir}/engine_{engine_idx}/logfile2.txt", "w"),
+            engine_dir,
+            [*task.model("smt2"), *([witness_proc] if witness_proc else [])],
+            f"cd {workdir}; {smtbmc_exe} {' '.join(smtbmc_opts)} --yw {yw_file} model/design_smt2.smt2",
+            logfile=open(f"{workdir}/{engine_dir}/logfile2.txt", "w"),
         )
 
-        proc2_status = None
-
-        last_prop = []
-        current_step = None
-
-        def output_callback2(line):
-            nonlocal proc2_status
-            nonlocal last_prop
-            nonlocal current_step
-
-            smt2_trans = {'\\':'/', '|':'/'}
-
-            def parse_mod_path(path_string):
-                # Match a path with . as delimiter, allowing escaped tokens in
-                # verilog `\name ` format
-                return [m[1] or m[0] for m in re.findall(r"(\\([^ ]*) |[^\.]+)(?:\.|$)", path_string)]
-
-            match = re.match(r"^## [0-9: ]+ .* in step ([0-9]+)\.\.", line)
-            if match:
-                current_step = int(match[1])
-                return line
-
-            match = re.match(r"^## [0-9: ]+ Status: FAILED", line)
-            if match: proc2_status = "FAIL"
-
-            match = re.match(r"^## [0-9: ]+ Status: PASSED", line)
-            if match: proc2_status = "PASS"
-
-            match = re.match(r"^## [0-9: ]+ Assert failed in ([^:]+): (\S+)(?: \((\S+)\))?", line)
-            if match:
-                path = parse_mod_path(match[1])
-                cell_name = match[3] or match[2]
-                prop = task.design.hierarchy.find_property(path, cell_name, trans_dict=smt2_trans)
-                prop.status = "FAIL"
-                task.status_db.set_task_property_status(prop, data=dict(source="aigsmt", engine=f"engine_{engine_idx}"))
-                last_prop.append(prop)
-                return line
-
-            match = re.match(r"^## [0-9: ]+ Writing trace to VCD file: (\S+)", line)
-            if match:
-                tracefile = match[1]
-                trace = os.path.basename(tracefile)[:-4]
-                task.summary.add_event(engine_idx=engine_idx, trace=trace, path=tracefile)
-
-            if match and last_prop:
-                for p in last_prop:
-                    task.summary.add_event(
-                        engine_idx=engine_idx, trace=trace,
-                        type=p.celltype, hdlname=p.hdlname, src=p.location, step=current_step)
-                    p.tracefiles.append(tracefile)
-                last_prop = []
-                return line
-
-            return line
-
-        def exit_callback2(retcode):
-            if proc2_status is None:
-                task.error(f"engine_{engine_idx}: Could not determine aigsmt status.")
-            if proc2_status != "FAIL":
-                task.error(f"engine_{engine_idx}: Unexpected aigsmt status.")
-
-        proc2.output_callback = output_callback2
-        proc2.register_exit_callback(exit_callback2)
+        state = SimpleNamespace()
+        state.task = task
+        state.engine_idx = engine_idx
+        state.add_event = task.summary.add_event
+        state.set_property_status = task.status_db.set_task_property_status
+        state.proc2_status = None
+        state.last_prop = []
+        state.current_step = None
+        state.found_props = {}
+
+        proc2.output_callback = partial(aigsmt_trace_output_callback, state)
+        proc2.register_exit_callback(partial(aigsmt_trace_exit_callback, state))
 
         final_proc = proc2
 
     if task.opt_fst or (task.opt_vcd and task.opt_vcd_sim):
-        final_proc = sim_witness_trace(f"engine_{engine_idx}", task, engine_idx, f"engine_{engine_idx}/{name}.yw", append=sim_append, deps=[final_proc])
+        final_proc = sim_witness_trace(engine_dir, task, engine_idx, f"{trace_prefix}.yw", append=sim_append, deps=[final_proc] if final_proc else [])
     elif not run_aigsmt:
-        task.log(f"{click.style(f'engine_{engine_idx}', fg='magenta')}: Engine did not produce a counter example.")
+        task.log(f"{click.style(engine_dir, fg='magenta')}: Engine did not produce a counter example.")
 
     return final_proc
+
+def aigsmt_trace_output_callback(state, line):
+    # All lines of interest are smtbmc status messages
+    if not line.startswith("## "):
+        return line
+
+    engine_idx = state.engine_idx
+
+    match = step_re.match(line)
+    if match:
+        state.current_step = int(match[1])
+        return line
+
+    match = assert_failed_re.match(line)
+    if match:
+        key = (match[1], match[3] or match[2])
+        prop = state.found_props.get(key)
+        if prop is None:
+            prop = state.task.design.hierarchy.find_property(parse_mod_path(key[0]), key[1], trans_dict=smt2_trans)
+            state.found_props[key] = prop
+        prop.status = "FAIL"
+        state.set_property_status(prop, data=dict(source="aigsmt", engine=f"engine_{engine_idx}"))
+        state.last_prop.append(prop)
+        return line
+
+    match = vcd_trace_re.match(line)
+    if match:
+        tracefile = match[1]
+        trace = os.path.basename(tracefile)[:-4]
+        add_event = state.add_event
+        add_event(engine_idx=engine_idx, trace=trace, path=tracefile)
+        for p in state.last_prop:
+            add_event(
+                engine_idx=engine_idx, trace=trace,
+                type=p.celltype, hdlname=p.hdlname, src=p.location, step=state.current_step)
+            p.tracefiles.append(tracefile)
+        state.last_prop = []
+        return line
+
+    match = status_failed_re.match(line)
+    if match: state.proc2_status = "FAIL"
+
+    match = status_passed_re.match(line)
+    if match: state.proc2_status = "PASS"
+
+    return line
+
+def aigsmt_trace_exit_callback(state, retcode):
+    if state.proc2_status is None:
+        state.task.error(f"engine_{state.engine_idx}: Could not determine aigsmt status.")
+    if state.proc2_status != "FAIL":
+        state.task.error(f"engine_{state.engine_idx}: Unexpected aigsmt status.")
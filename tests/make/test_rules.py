@@ -54,8 +54,12 @@ with rules_file.open("w") as rules:
 
         for mode_engines in info["engines"].values():
             for engine in mode_engines:
+                engine_args = engine
                 engine, solver = parse_engine(engine)
                 engines.add(engine)
+                if (engine, solver) == ("aiger", "portfolio"):
+                    for member in engine_args[-1].split(","):
+                        required_tools.update(REQUIRED_TOOLS.get((engine, member), ()))
                 required_tools.update(
                     REQUIRED_TOOLS.get((engine, solver), REQUIRED_TOOLS.get(engine, ()))
                 )